@@ -1,11 +1,22 @@
+import importlib
+
 from .cli import main
 from .processor import build_sample_dict
 from .references import ReferenceManager
-from .sylph import SylphUtils
-from .hmo_genes import HMOUtils
-from .plotting import PlotUtils
 from .logger import logger
 
+# These pull in pandas/matplotlib/sklearn, so only import them on first access
+_LAZY_IMPORTS = {
+	"SylphUtils": ".sylph",
+	"HMOUtils": ".hmo_genes",
+	"PlotUtils": ".plotting",
+}
+
+def __getattr__(name):
+	if name in _LAZY_IMPORTS:
+		return getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 __version__ = "0.2.1"
 
 __all__ = [
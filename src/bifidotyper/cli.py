@@ -3,19 +3,15 @@ import sys
 from .processor import build_sample_dict
 from .references import ReferenceManager
 import glob
+import re
 import platform
 import os
 import subprocess
 import shutil
-from .sylph import SylphUtils
-from .hmo_genes import HMOUtils
-from .plotting import PlotUtils
 from .logger import logger
-from .phylogenetic import PhylogeneticUtils
-import tqdm
-
+import functools
+import concurrent.futures
 import warnings
-warnings.filterwarnings("ignore")
 
 
 disable_tqdm = not sys.stdout.isatty()  # Disable if output is redirected
@@ -47,6 +43,8 @@ def parse_args():
     
     parser.add_argument('-r', '--rpm-threshold', type=float, default=10, help="Minimum RPM threshold for HMO genes to be considered present (default: 10).")
 
+    parser.add_argument('--no-pdf', action='store_true', default=False, help="Only write PNG plots, skipping the PDF copies.")
+
     parser.add_argument('-t', '--threads', type=int, default=1, help="Number of threads to use for parallel processing.")
 
     parser.add_argument('-v', '--verbose', action='store_true', help="Enable verbose output.", default=False)
@@ -65,6 +63,44 @@ def parse_args():
     
     return args
 
+@functools.lru_cache(maxsize=None)
+def _glob_pattern(pattern):
+    # Cached so repeated patterns only hit the filesystem once
+    expanded = glob.glob(pattern)
+    return tuple(expanded) if expanded else (pattern,)
+
+def expand_patterns(patterns):
+    """Expand wildcards manually (Windows shells won't expand globs)."""
+    # Directory scans are latency-bound on network filesystems, so expand
+    # distinct patterns concurrently; output keeps the input order
+    unique_patterns = list(dict.fromkeys(patterns))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(32, len(unique_patterns))) as executor:
+        expanded = dict(zip(unique_patterns, executor.map(_glob_pattern, unique_patterns)))
+    return [file for pattern in patterns for file in expanded[pattern]]
+
+@functools.lru_cache(maxsize=None)
+def _sample_name_regex(r1_suffix, r2_suffix):
+    # One pass strips the FASTQ extension and every R1/R2 suffix occurrence
+    return re.compile(rf'\.f(?:ast)?q(?:\.gz)?$|{re.escape(r1_suffix)}|{re.escape(r2_suffix)}')
+
+def get_sample_name(fastq, r1_suffix, r2_suffix):
+    return _sample_name_regex(r1_suffix, r2_suffix).sub('', os.path.basename(fastq))
+
+def _run_hmo_sample(job):
+    """Quantify HMO genes for one sample."""
+    from .hmo_genes import HMOUtils
+    args, salmon_exec, refs, sample_name, fastqs, threads = job
+    HMOUtils(args=args,
+             salmon_executable=salmon_exec,
+             sample_name=sample_name,
+             genes_fasta=refs['bl_genes'],
+             hmo_annotations=refs['humann2_hmo'],
+             output_dir='hmo_quantification',
+             threads=threads,
+             **fastqs)
+    return sample_name
+
+@functools.lru_cache(maxsize=1)
 def get_reference_files():
     try:
         ref_manager = ReferenceManager()
@@ -95,24 +131,27 @@ def main():
 
     args = parse_args()
 
+    # Heavy imports (pandas, matplotlib, sklearn, Biopython) are deferred until
+    # the arguments are valid, so --help and usage errors return immediately
+    warnings.filterwarnings("ignore")
+    import tqdm
+    from .sylph import SylphUtils
+    from .hmo_genes import HMOUtils
+    from .plotting import PlotUtils
+    from .phylogenetic import PhylogeneticUtils
+
     print('Loading software and reference data...')
 
     # Expand any wildcards manually (Windows shells won't expand globs)
     se_files = None
     pe_files = None
     if args.single_end:
-        se_files = []
-        for pattern in args.single_end:
-            expanded = glob.glob(pattern)
-            se_files.extend(expanded if expanded else [pattern])
+        se_files = expand_patterns(args.single_end)
         sample_dict = build_sample_dict(single_end=se_files,
                                         r1_suffix=args.r1_suffix,
                                         r2_suffix=args.r2_suffix)
     elif args.paired_end:
-        pe_files = []
-        for pattern in args.paired_end:
-            expanded = glob.glob(pattern)
-            pe_files.extend(expanded if expanded else [pattern])
+        pe_files = expand_patterns(args.paired_end)
         sample_dict = build_sample_dict(paired_end=pe_files,
                                         r1_suffix=args.r1_suffix,
                                         r2_suffix=args.r2_suffix)
@@ -153,8 +192,15 @@ def main():
             read_sketches = sylph_u.sketch_reads(fastq_r1=fastq_files_r1, fastq_r2=fastq_files_r2, threads=args.threads)
 
         print('Querying samples against genomes...')
-        query_result = sylph_u.query_genomes(read_sketches, genome_db)
-        profile_result = sylph_u.profile_genomes(read_sketches, genome_db)
+        # query and profile only read the sketches, so run them side by side,
+        # splitting --threads between them. With the default single thread,
+        # pass no -t and let each use sylph's own default thread count
+        sylph_threads = max(1, args.threads // 2) if args.threads > 1 else None
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            query_future = executor.submit(sylph_u.query_genomes, read_sketches, genome_db, threads=sylph_threads)
+            profile_future = executor.submit(sylph_u.profile_genomes, read_sketches, genome_db, threads=sylph_threads)
+            query_result = query_future.result()
+            profile_result = profile_future.result()
 
         logger.info(f"Query result: {query_result}")
         logger.info(f"Profile result: {profile_result}")
@@ -166,54 +212,47 @@ def main():
     # Now run HMO quantification
     print('Detecting HMO genes...')
 
-    def get_sample_name(fastq):
-        name = os.path.basename(fastq)
-        for ext in ('.fastq.gz', '.fq.gz', '.fastq', '.fq'):
-            if name.endswith(ext):
-                name = name[: -len(ext)]
-                break
-        # Remove suffixes if present
-        name = name.replace(args.r1_suffix, '').replace(args.r2_suffix, '')
-        return name
+    # Snapshot the quantification outputs once instead of stat-ing per sample
+    existing_outputs = set(os.listdir('hmo_quantification')) if os.path.isdir('hmo_quantification') else set()
+
+    def has_hmo_outputs(sample_name):
+        return (f'{sample_name}.salmon_counts_annotated.tsv' in existing_outputs
+                and f'{sample_name}.cluster_presence.tsv' in existing_outputs)
 
+    # Collect the samples that still need quantification
+    jobs = []
     if args.single_end:
-        missing_samples = []
         for fastq_se in fastq_files:
-            sample_name = get_sample_name(fastq_se)
-            if not os.path.exists(f'hmo_quantification/{sample_name}.salmon_counts_annotated.tsv') or not os.path.exists(f'hmo_quantification/{sample_name}.cluster_presence.tsv'):
-                missing_samples.append(fastq_se)
-    
-        if len(missing_samples) > 0:
-            for fastq_se in tqdm.tqdm(missing_samples, desc="Quantifying HMO genes", unit="samples", total=len(missing_samples), disable=disable_tqdm):
-                sample_name = get_sample_name(fastq_se)
-                HMOUtils(args=args,
-                         salmon_executable=salmon_exec,
-                         sample_name=sample_name,
-                         genes_fasta=refs['bl_genes'],
-                         hmo_annotations=refs['humann2_hmo'],
-                         fastq_se=fastq_se,
-                         output_dir='hmo_quantification',
-                         threads=args.threads)
+            sample_name = get_sample_name(fastq_se, args.r1_suffix, args.r2_suffix)
+            if not has_hmo_outputs(sample_name):
+                jobs.append((sample_name, {'fastq_se': fastq_se}))
     else:
-        missing_samples = []
         for fastq_r1, fastq_r2 in zip(fastq_files_r1, fastq_files_r2):
-            sample_name = get_sample_name(fastq_r1)
-            if not os.path.exists(f'hmo_quantification/{sample_name}.salmon_counts_annotated.tsv') or not os.path.exists(f'hmo_quantification/{sample_name}.cluster_presence.tsv'):
-                missing_samples.append((fastq_r1, fastq_r2))
-        
-        if len(missing_samples) > 0:
-            for fastq_r1, fastq_r2 in tqdm.tqdm(missing_samples, desc="Quantifying HMO genes", unit="samples", total=len(missing_samples), disable=disable_tqdm):
-                sample_name = get_sample_name(fastq_r1)
-                HMOUtils(args=args,
-                         salmon_executable=salmon_exec,
-                         sample_name=sample_name,
-                         genes_fasta=refs['bl_genes'],
-                         hmo_annotations=refs['humann2_hmo'],
-                         fastq_pe1=fastq_r1,
-                         fastq_pe2=fastq_r2,
-                         output_dir='hmo_quantification',
-                         threads=args.threads)
-    
+            sample_name = get_sample_name(fastq_r1, args.r1_suffix, args.r2_suffix)
+            if not has_hmo_outputs(sample_name):
+                jobs.append((sample_name, {'fastq_pe1': fastq_r1, 'fastq_pe2': fastq_r2}))
+
+    if len(jobs) > 0:
+        # Build the salmon index once up front, before any sample needs it
+        HMOUtils.ensure_index(salmon_executable=salmon_exec,
+                              genes_fasta=refs['bl_genes'],
+                              output_dir='hmo_quantification',
+                              verbose=args.verbose)
+
+        # Split threads between concurrent samples and salmon's own -p
+        outer_workers = min(len(jobs), max(1, args.threads // 4))
+        inner_threads = max(1, args.threads // outer_workers)
+        jobs = [(args, salmon_exec, refs, sample_name, fastqs, inner_threads) for sample_name, fastqs in jobs]
+        progress = dict(desc="Quantifying HMO genes", unit="samples", total=len(jobs), disable=disable_tqdm)
+        if outer_workers == 1:
+            for job in tqdm.tqdm(jobs, **progress):
+                _run_hmo_sample(job)
+        else:
+            # salmon does the work in its own subprocess, so threads are enough;
+            # they also keep all logging on the parent's single log handler
+            with concurrent.futures.ThreadPoolExecutor(max_workers=outer_workers) as executor:
+                list(tqdm.tqdm(executor.map(_run_hmo_sample, jobs), **progress))
+
     # Run plotting
     print('Plotting results...')
     logger.info("Plotting results...")
@@ -238,7 +277,8 @@ def main():
         phylo_utils = PhylogeneticUtils(
             genomes_df=refs['genomes_df'],
             sylph_profile='sylph_genome_queries/genome_profile.tsv',
-            output_dir='plots'
+            output_dir='plots',
+            threads=args.threads
         )
         tree = phylo_utils.generate_phylogenetic_tree()
         phylo_utils.plot_cladogram(tree)
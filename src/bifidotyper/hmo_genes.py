@@ -2,12 +2,27 @@ import os
 import glob
 import subprocess
 import typing
+import functools
+import re
 from pathlib import Path
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
 from .logger import logger
+from .utils import CSV_ENGINE
+
+_BLON_ID_RE = re.compile(r'(?<!\S)Blon_\d+(?!\S)')
+
+
+@functools.lru_cache(maxsize=None)
+def _load_hmo_annotations(path: str, mtime: float) -> pd.DataFrame:
+    # Parsed once per annotation file; mtime is part of the key so edits are picked up
+    hmo = pd.read_csv(path, sep=';', engine=CSV_ENGINE)[['Blon','Cluster']]
+    hmo = hmo.rename(columns={'Blon':'Name'})
+    # Some cells have multiple "Blon" ids; pull out every whole "Blon_XXXX" token
+    # in one regex pass and give each its own row
+    hmo = hmo.assign(Name=hmo.Name.str.findall(_BLON_ID_RE)).explode('Name')
+    return hmo.dropna(subset=['Name'])
+
 
 class HMOUtils:
     def __init__(self,
@@ -62,57 +77,80 @@ class HMOUtils:
         self.process_gene_counts()
 
     
-    def _run_command(self, command: typing.List[str], logfile: str = None, stdout=None) -> subprocess.CompletedProcess:
-        if logfile:
-            logfile = open(logfile, 'w')
-        else:
-            logfile = subprocess.DEVNULL
-        
-        if stdout:
-            stdout = open(stdout, 'w')
-        else:
-            stdout = logfile
-        
+    @staticmethod
+    def _run_command(command: typing.List[str], log: typing.IO = subprocess.DEVNULL, verbose: bool = False) -> subprocess.CompletedProcess:
+        """Run a command with stdout/stderr sent to an already-open log file (or discarded)."""
         try:
-            if self.args.verbose:
+            if verbose:
                 logger.info(f"Running command: {' '.join(command)}")
-            subprocess.run(command, check=True, text=True, capture_output=False, shell=False, stdout=stdout, stderr=logfile)
+            return subprocess.run(command, check=True, shell=False, stdout=log, stderr=log)
         except subprocess.CalledProcessError:
             logger.exception(f"Command failed: {' '.join(command)}")
             raise
     
+    @classmethod
+    def ensure_index(cls, salmon_executable: str, genes_fasta: str, output_dir: str = 'hmo_quantification', verbose: bool = False) -> str:
+        """Build the shared B. longum salmon index if it doesn't exist yet.
+
+        Call this once before quantifying samples so per-sample runs (possibly
+        in parallel) never race to build it.
+        """
+        index_dir = os.path.join(output_dir, 'B_longum_salmon_index')
+        if not os.path.exists(index_dir):
+            os.makedirs(output_dir, exist_ok=True)
+            index_cmd = [salmon_executable, 'index', '-t', genes_fasta, '-i', index_dir]
+            with open(os.path.join(output_dir, 'salmon_index.log'), 'wb', buffering=0) as log:
+                cls._run_command(index_cmd, log, verbose=verbose)
+        return index_dir
+
     def run_salmon(self):
-        
-        if not os.path.exists(os.path.join(self.output_dir, 'B_longum_salmon_index')):
-            index_cmd = [self.salmon_executable, 'index', '-t', self.genes_fasta, '-i', os.path.join(self.output_dir, 'B_longum_salmon_index')]
-            self._run_command(index_cmd, logfile=os.path.join(self.output_dir, 'salmon_index.log'))
+
+        # No-op when cli.main has already built the index; keeps standalone use working
+        index_dir = self.ensure_index(self.salmon_executable, self.genes_fasta, self.output_dir, verbose=self.args.verbose)
+        quant_dir = os.path.join(self.output_dir, self.sample_name+'_salmon')
+        quant_log = quant_dir + '.log'
 
         if self.fastq_se:
-            quant_cmd = [self.salmon_executable, 'quant', '-i', os.path.join(self.output_dir, 'B_longum_salmon_index'), '-l', 'A', '-r', self.fastq_se, '-p', str(self.threads), '--validateMappings', '-o', os.path.join(self.output_dir, self.sample_name+'_salmon')]
+            reads = ['-r', self.fastq_se]
         else:
-            quant_cmd = [self.salmon_executable, 'quant', '-i', os.path.join(self.output_dir, 'B_longum_salmon_index'), '-l', 'A', '-1', self.fastq_pe1, '-2', self.fastq_pe2, '-p', str(self.threads), '--validateMappings', '-o', os.path.join(self.output_dir, self.sample_name+'_salmon')]
-        self._run_command(quant_cmd, logfile=os.path.join(self.output_dir, self.sample_name+'_salmon.log'))
+            reads = ['-1', self.fastq_pe1, '-2', self.fastq_pe2]
+        quant_cmd = [self.salmon_executable, 'quant', '-i', index_dir, '-l', 'A', *reads, '-p', str(self.threads), '--validateMappings', '--no-version-check', '-o', quant_dir]
+        with open(quant_log, 'wb', buffering=0) as log:
+            self._run_command(quant_cmd, log, verbose=self.args.verbose)
 
 
     def process_gene_counts(self):
-        salmon_counts = pd.read_csv(os.path.join(self.output_dir, self.sample_name+'_salmon','quant.sf'), sep='\t')
-
-        hmo = pd.read_csv(self.hmo_annotations,sep=';')[['Blon','Cluster']]
-        hmo = hmo.rename(columns={'Blon':'Name'})
-        # Some cells have multiple "Blon" ids, we need to split them into separate rows
-        hmo = hmo.assign(Name=hmo.Name.str.split(' ')).explode('Name')
-        # Now remove any row that doesn't match the format "Blon_XXXX"
-        hmo = hmo[hmo['Name'].str.match(r'Blon_\d+')]
-
-        salmon_counts = pd.merge(salmon_counts,hmo,left_on='Name',right_on='Name',how='left')
-        salmon_counts.dropna(inplace=True)
-        salmon_counts['Present'] = salmon_counts['NumReads'] > self.rpm_threshold
-        salmon_counts.to_csv(os.path.join(self.output_dir,self.sample_name+'.salmon_counts_annotated.tsv'), index=False, sep='\t')
-        logger.info('Saved annotated salmon counts to {}'.format(os.path.join(self.output_dir,self.sample_name+'.salmon_counts_annotated.tsv')))
-
-        clusters = salmon_counts.groupby('Cluster')['Present'].all().reset_index()
-        clusters.to_csv(os.path.join(self.output_dir,self.sample_name+'.cluster_presence.tsv'), index=False, sep='\t')
-        logger.info('Saved cluster presence table to {}'.format(os.path.join(self.output_dir,self.sample_name+'.cluster_presence.tsv')))
+        counts_path = os.path.join(self.output_dir, self.sample_name+'.salmon_counts_annotated.tsv')
+        clusters_path = os.path.join(self.output_dir, self.sample_name+'.cluster_presence.tsv')
+
+        # Every quant.sf column is kept for the annotated table; only the ones
+        # used below get dtype hints. The table is written back out, so it is
+        # parsed with the C engine: pyarrow can round floats differently and
+        # the TSV would then depend on whether it happens to be installed
+        salmon_counts = pd.read_csv(os.path.join(self.output_dir, self.sample_name+'_salmon','quant.sf'), sep='\t', engine='c',
+                                    dtype={'Name': str, 'TPM': 'float64', 'NumReads': 'float64'})
+
+        hmo = _load_hmo_annotations(self.hmo_annotations, os.path.getmtime(self.hmo_annotations))
+
+        # hmo is a plain Name -> Cluster lookup, so a map is cheaper than a join
+        name_to_cluster = dict(zip(hmo['Name'].values, hmo['Cluster'].values))
+        salmon_counts['Cluster'] = salmon_counts['Name'].map(name_to_cluster)
+        salmon_counts.dropna(subset=['Cluster'], inplace=True)
+        # Compare on the raw float array (no copy); the result stays a plain numpy
+        # bool column so the TSV keeps its True/False values
+        num_reads = salmon_counts['NumReads'].to_numpy(dtype=np.float64, copy=False)
+        salmon_counts['Present'] = np.greater(num_reads, self.rpm_threshold)
+        salmon_counts.to_csv(counts_path, index=False, sep='\t')
+        logger.info('Saved annotated salmon counts to {}'.format(counts_path))
+
+        # A cluster is present when every one of its genes is; bincount over the
+        # (sorted) cluster codes gives the same table as groupby().all()
+        codes, cluster_names = pd.factorize(salmon_counts['Cluster'], sort=True)
+        n_genes = np.bincount(codes, minlength=len(cluster_names))
+        n_present = np.bincount(codes, weights=salmon_counts['Present'].to_numpy(), minlength=len(cluster_names))
+        clusters = pd.DataFrame({'Cluster': cluster_names, 'Present': n_present == n_genes})
+        clusters.to_csv(clusters_path, index=False, sep='\t')
+        logger.info('Saved cluster presence table to {}'.format(clusters_path))
 
 
 # Example usage
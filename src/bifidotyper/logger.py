@@ -28,6 +28,11 @@ class BifidoLogger:
         """Configure the logger with both file and console handlers."""
         # Create logger
         self.logger = logging.getLogger('bifidotyper')
+        
+        # The 'bifidotyper' logger is a process-wide singleton; configure it only
+        # once so repeated instances don't reopen the log file
+        if getattr(self.logger, '_bifido_configured', False):
+            return
         self.logger.setLevel(self.level)
         
         # Remove any existing handlers
@@ -63,6 +68,8 @@ class BifidoLogger:
         # Set matplotlib to WARNING level to reduce noise
         logging.getLogger('matplotlib').setLevel(logging.WARNING)
         
+        self.logger._bifido_configured = True
+        
     def set_level(self, level):
         """Change the logging level.
         
@@ -74,8 +81,31 @@ class BifidoLogger:
         for handler in self.logger.handlers:
             handler.setLevel(level)
 
-# Create default logger instance
-logger = BifidoLogger().logger
+_logger = None
+
+def get_logger():
+    """Return the package logger, installing its handlers on first use.
+    
+    Returns:
+        logging.Logger: The configured 'bifidotyper' logger.
+    """
+    global _logger
+    if _logger is None:
+        _logger = BifidoLogger().logger
+    return _logger
+
+class _LazyLogger:
+    """Stand-in for the package logger that defers handler setup until first use.
+    
+    Importing the package therefore doesn't open the log file or build
+    formatters unless something is actually logged.
+    """
+    
+    def __getattr__(self, name):
+        return getattr(get_logger(), name)
+
+# Default logger instance used throughout the package
+logger = _LazyLogger()
 
 if __name__ == "__main__":
     logger.info("Logger is configured and ready to use.")
\ No newline at end of file
@@ -1,20 +1,81 @@
 import os
+import concurrent.futures
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from Bio import Phylo
-from Bio.Phylo.TreeConstruction import DistanceTreeConstructor, DistanceMatrix
-from Bio.Phylo.BaseTree import Clade
-from Bio.SeqIO import parse
 from .logger import logger
 
+# Maps ASCII bytes to 2-bit base codes (either case); everything else becomes 4
+_BASE_LUT = np.full(256, 4, dtype=np.uint8)
+for _code, _base in enumerate(b'ACGT'):
+    _BASE_LUT[_base] = _code
+    _BASE_LUT[_base + 32] = _code
+
+def _kmer_codes(seq: bytes, k: int) -> np.ndarray:
+    """Pack every A/C/G/T-only k-mer in seq into a uint64 (2 bits per base)."""
+    n = len(seq) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64)
+    bases = _BASE_LUT[np.frombuffer(seq, dtype=np.uint8)]
+    codes = np.zeros(n, dtype=np.uint64)
+    for i in range(k):
+        codes |= bases[i:i + n].astype(np.uint64) << np.uint64(2 * (k - 1 - i))
+    # Drop windows that contain an ambiguous base
+    ambiguous = np.concatenate(([0], np.cumsum(bases > 3)))
+    return codes[ambiguous[k:] == ambiguous[:-k]]
+
+def _fasta_sequences(path):
+    """Yield each record's sequence as raw bytes with line breaks removed.
+
+    Much lighter than Bio.SeqIO: no SeqRecord/Seq objects, and the bytes feed
+    straight into the k-mer encoder.
+    """
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    start = data.find(b'>')
+    if start == -1:
+        return
+    for record in data[start + 1:].split(b'\n>'):
+        _, _, body = record.partition(b'\n')
+        yield body.translate(None, b' \t\r\n')
+
+def _splitmix64(codes: np.ndarray) -> np.ndarray:
+    """Vectorized splitmix64 finalizer; spreads k-mer codes uniformly over uint64."""
+    with np.errstate(over='ignore'):
+        z = codes + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+# Signatures handed to each pool worker once via the initializer, not per task
+_worker_sigs = None
+_worker_sketch_size = None
+
+def _init_pair_worker(sigs, sketch_size):
+    global _worker_sigs, _worker_sketch_size
+    _worker_sigs = sigs
+    _worker_sketch_size = sketch_size
+
+def _pair_distance(pair):
+    i, j = pair
+    # Convert similarity to distance
+    return i, j, max(0.0, 1.0 - PhylogeneticUtils._jaccard(_worker_sigs[i], _worker_sigs[j], _worker_sketch_size))
+
 class PhylogeneticUtils:
-    def __init__(self, genomes_df: str, sylph_profile: str, output_dir: str = 'plots'):
+    def __init__(self, genomes_df: str, sylph_profile: str, output_dir: str = 'plots', threads: int = 1, sketch_size: int = None):
         self.genomes_df = pd.read_csv(genomes_df)
         self.sylph_profile = pd.read_csv(sylph_profile, sep='\t')
         self.output_dir = output_dir
+        self.threads = threads
+        # Bottom-s MinHash size; None compares exact k-mer sets
+        self.sketch_size = sketch_size
+        # k-mer signatures keyed by (path, mtime, k, sketch_size), shared across tree builds
+        self._sig_cache = {}
         os.makedirs(self.output_dir, exist_ok=True)
 
     def generate_phylogenetic_tree(self):
+        from Bio import Phylo
+        from Bio.Phylo.TreeConstruction import DistanceTreeConstructor
+
         # Extract strains and genome file paths
         strains = self.genomes_df['Label'].unique()
         genome_files = dict(zip(self.genomes_df['Label'], self.genomes_df['Genome_file']))
@@ -33,6 +94,8 @@ class PhylogeneticUtils:
         return tree
 
     def _build_ani_matrix(self, strains, genome_files):
+        from Bio.Phylo.TreeConstruction import DistanceMatrix
+
         # Create a lower-triangular distance matrix based on an ANI-like score
         labels = list(strains)
         n = len(labels)
@@ -42,17 +105,22 @@ class PhylogeneticUtils:
             matrix = [[0.0], [0.0, 0.0]]
             return DistanceMatrix(labels, matrix)
 
-        matrix = []
-        for i in range(n):
-            row = []
-            for j in range(i + 1):
-                if i == j:
-                    row.append(0.0)
-                else:
-                    ani = self._calculate_ani(genome_files[labels[i]], genome_files[labels[j]])
-                    # Convert similarity to distance
-                    row.append(max(0.0, 1.0 - ani))
-            matrix.append(row)
+        # Parse each genome once; pairs then only compare cached signatures
+        sigs = [self._kmer_signature(genome_files[label]) for label in labels]
+
+        # Pairs are independent, so spread them over a process pool when allowed
+        pairs = [(i, j) for i in range(n) for j in range(i)]
+        if self.threads > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.threads,
+                                                        initializer=_init_pair_worker,
+                                                        initargs=(sigs, self.sketch_size)) as executor:
+                distances = list(executor.map(_pair_distance, pairs, chunksize=max(1, len(pairs) // (self.threads * 4))))
+        else:
+            distances = [(i, j, max(0.0, 1.0 - self._jaccard(sigs[i], sigs[j], self.sketch_size))) for i, j in pairs]
+
+        matrix = [[0.0] * (i + 1) for i in range(n)]
+        for i, j, distance in distances:
+            matrix[i][j] = distance
         return DistanceMatrix(labels, matrix)
 
     def _calculate_ani(self, genome_file_1, genome_file_2, k: int = 8):
@@ -61,25 +129,47 @@ class PhylogeneticUtils:
         This avoids heavy alignments and external tools, providing a stable
         fallback that produces values in [0,1].
         """
+        return self._jaccard(self._kmer_signature(genome_file_1, k), self._kmer_signature(genome_file_2, k), self.sketch_size)
+
+    @staticmethod
+    def _jaccard(kmers1: np.ndarray, kmers2: np.ndarray, sketch_size: int = None) -> float:
+        """Jaccard index of two sorted, unique k-mer code (or sketch hash) arrays.
+
+        With a sketch size, the inputs are bottom-s MinHash sketches and the
+        result is the standard estimate: the share of the s smallest hashes of
+        the union that appear in both sketches. Sets no larger than s give the
+        exact value.
+        """
+        if not kmers1.size or not kmers2.size:
+            return 0.0
+        if sketch_size:
+            union = np.union1d(kmers1, kmers2)[:sketch_size]
+            shared = np.intersect1d(kmers1, kmers2, assume_unique=True)
+            return np.searchsorted(shared, union[-1], side='right') / union.size
+        inter = np.intersect1d(kmers1, kmers2, assume_unique=True).size
+        union = kmers1.size + kmers2.size - inter
+        return inter / union if union else 0.0
+
+    def _kmer_signature(self, genome_file, k: int = 8) -> np.ndarray:
+        """Sorted, unique k-mer codes across all contigs of a FASTA file (cached)."""
         try:
-            kmers1 = set()
-            for rec in parse(genome_file_1, "fasta"):
-                s = str(rec.seq).upper()
-                kmers1.update(s[i:i+k] for i in range(0, max(0, len(s) - k + 1)))
-            kmers2 = set()
-            for rec in parse(genome_file_2, "fasta"):
-                s = str(rec.seq).upper()
-                kmers2.update(s[i:i+k] for i in range(0, max(0, len(s) - k + 1)))
-            if not kmers1 or not kmers2:
-                return 0.0
-            inter = len(kmers1 & kmers2)
-            union = len(kmers1 | kmers2)
-            return inter / union if union else 0.0
+            key = (genome_file, os.path.getmtime(genome_file), k, self.sketch_size)
+            if key not in self._sig_cache:
+                codes = [_kmer_codes(seq, k) for seq in _fasta_sequences(genome_file)]
+                sig = np.unique(np.concatenate(codes)) if codes else np.empty(0, dtype=np.uint64)
+                if self.sketch_size:
+                    # Keep only the s smallest hashes (bottom-s MinHash sketch)
+                    sig = np.unique(_splitmix64(sig))[:self.sketch_size]
+                self._sig_cache[key] = sig
+            return self._sig_cache[key]
         except Exception as e:
-            logger.error(f"Error calculating ANI between {genome_file_1} and {genome_file_2}: {e}")
-            return 0.0
+            logger.error(f"Error reading k-mers from {genome_file}: {e}")
+            return np.empty(0, dtype=np.uint64)
 
     def plot_cladogram(self, tree):
+        import matplotlib.pyplot as plt
+        from Bio import Phylo
+
         # Plot the phylogenetic tree as a cladogram
         fig, ax = plt.subplots(figsize=(10, 8), dpi=300)
         Phylo.draw(tree, axes=ax, do_show=False)
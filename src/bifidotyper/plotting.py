@@ -1,10 +1,18 @@
 import os
+import re
 import glob
+import concurrent.futures
 from .logger import logger
+from .utils import CSV_ENGINE
 import pandas as pd
 import numpy as np
 import seaborn as sns
+import matplotlib
+# Non-interactive backend: figures are only ever written to disk
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+# Figures are closed after saving; don't warn when many samples are plotted
+plt.rcParams['figure.max_open_warning'] = 0
 from matplotlib.path import Path
 from matplotlib.patches import PathPatch
 from matplotlib.colors import ListedColormap, Normalize
@@ -14,7 +22,41 @@ from sklearn.metrics import silhouette_score
 import natsort
 import palettable
 import json
-import gzip
+# python-isal's igzip is a drop-in, much faster gzip reader; optional
+try:
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
+
+def _save_figure(fig, path_stem, dpi=300, png_dpi=None, pdf=True):
+    """Save fig as <path_stem>.pdf (unless pdf=False) and <path_stem>.png.
+
+    bbox_inches='tight' lays out the whole figure again on every savefig call,
+    so the tight box is computed once here and shared by both formats.
+    """
+    # draw_without_rendering() (matplotlib>=3.6) lays the figure out without
+    # rasterizing it; older matplotlib has to fall back to a full canvas draw
+    if hasattr(fig, 'draw_without_rendering'):
+        fig.draw_without_rendering()
+    else:
+        fig.canvas.draw()
+    bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(0.1)
+    if pdf:
+        fig.savefig(f'{path_stem}.pdf', dpi=dpi, bbox_inches=bbox)
+    fig.savefig(f'{path_stem}.png', dpi=png_dpi or dpi, bbox_inches=bbox)
+
+def _strip_regex(*fragments):
+    # Alternation of the literal fragments, longest first so overlapping
+    # suffixes are removed whole; empty fragments would match everywhere
+    fragments = sorted({f for f in fragments if f}, key=len, reverse=True)
+    return re.compile('|'.join(map(re.escape, fragments)))
+
+def _plot_containment_sample(job):
+    """Draw and save one sample's containment plot. Module-level so worker processes can unpickle it."""
+    sample_df, path_stem, pdf = job
+    fig = PlotUtils.containment_indices_barplot_horiz(sample_df)
+    _save_figure(fig, path_stem, pdf=pdf)
+    plt.close(fig)
 
 class PlotUtils:
     def __init__(self,args,sylph_profile:str,sylph_query:str,hmo_genes:str,genomes_df:str,output_dir:str='plots'):
@@ -27,7 +69,12 @@ class PlotUtils:
         self.genomes_df = pd.read_csv(genomes_df)
         self.rpm_threshold = args.rpm_threshold
         self.output_dir = output_dir
+        self._profile = None
+        self._query = None
 
+        # Strip FASTQ extensions and read suffixes from sylph's Sample_file in one pass
+        self._profile_sample_re = _strip_regex('.gz', '.fastq', args.r1_suffix, args.r2_suffix)
+        self._query_sample_re = _strip_regex('.fastq.gz', args.r1_suffix, args.r2_suffix)
 
         os.makedirs(self.output_dir,exist_ok=True)
         
@@ -40,17 +87,37 @@ class PlotUtils:
         self.load_sylph()
         self.load_salmon_df()
     
+    def _save_plot(self, fig, name, **kwargs):
+        _save_figure(fig, os.path.join(self.output_dir,name), pdf=not self.args.no_pdf, **kwargs)
+
+    # Plain lazily-set attributes rather than functools.cached_property,
+    # which needs Python 3.8
+    @property
+    def _profile_df(self):
+        # Parsed once and shared; callers take a copy before modifying it.
+        # Re-serialized to sylph_profile_results.csv, so use the C engine for
+        # floats that don't depend on whether pyarrow is installed
+        if self._profile is None:
+            self._profile = pd.read_csv(self.sylph_profile,sep='\t',engine='c')
+        return self._profile
+
+    @property
+    def _query_df(self):
+        # Only the containment plots read the query table
+        if self._query is None:
+            self._query = pd.read_csv(self.sylph_query,sep='\t',engine=CSV_ENGINE,
+                                      usecols=['Sample_file','Genome_file','Contig_name','Containment_ind'])
+        return self._query
+
     def load_sylph(self):
 
-        pdf = pd.read_csv(self.sylph_profile,sep='\t')
+        pdf = self._profile_df.copy()
 
-        pdf['Sample'] = pdf['Sample_file'].apply(lambda x: os.path.basename(x).replace('.gz','').replace('.fastq','').replace(self.args.r1_suffix,'').replace(self.args.r2_suffix,''))
+        pdf['Sample'] = pdf['Sample_file'].map(os.path.basename).str.replace(self._profile_sample_re,'',regex=True)
         pdf = pdf.merge(self.genomes_df,how='left',on='Genome_file').drop_duplicates()
         pdf['Strain'] = pdf['Label']
         strains = pdf['Strain'].unique()
 
-        # pdf.to_csv('/home/bebr1814/playground/plotting_df.csv')
-
         if pdf['Strain'].nunique() < 20:
             # use palettable.tableau.GreenOrange_12.mpl_colormap as the colormap
             cmap = ListedColormap(palettable.tableau.GreenOrange_12.mpl_colors)
@@ -58,7 +125,7 @@ class PlotUtils:
         else:
             # Try using the colors from the pdf
             # 'Color' contains a unique hex code for each strain, grouped by ANI clustering
-            self.strain_colors = {strain: pdf[pdf['Strain'] == strain]['Color'].values[0] for strain in pdf['Strain'].unique()}
+            self.strain_colors = pdf.drop_duplicates('Strain').set_index('Strain')['Color'].to_dict()
         
         self.pdf = pdf
 
@@ -68,13 +135,11 @@ class PlotUtils:
         pdf = self.pdf
         salmon_df = self.salmon_df
         
+        # Wide Sample x Strain table, shared by the heatmap and the stacked barplot
+        abund = pdf.pivot(index='Sample', columns='Strain', values='Taxonomic_abundance')
+
         ### Taxonomic Abundance Heatmap ###
-        heatmap_data = pdf.pivot_table(
-            index='Sample', 
-            columns='Strain', 
-            values='Taxonomic_abundance', 
-            aggfunc='first'
-        )
+        heatmap_data = abund.dropna(how='all')
 
         # Remove columns where the highest value is lower than 5
         heatmap_data = heatmap_data.loc[:, heatmap_data.max() >= 5]
@@ -99,10 +164,14 @@ class PlotUtils:
         # Custom color palette with ascending purple
         cmap = sns.color_palette('Purples', as_cmap=True)
 
+        # Per-cell labels and edge strokes dominate savefig time on large
+        # matrices, so those are drawn as a single raster mesh without them
+        large = heatmap_data.size > 2500
+
         # Generate heatmap
         sns.heatmap(
             heatmap_data, 
-            annot=True,  # Show values
+            annot=not large,  # Show values
             fmt='.1f',   # Rounded values
             cmap=cmap,   # Color palette
             mask=mask,   # Mask missing values
@@ -110,7 +179,8 @@ class PlotUtils:
                 'label': 'Taxonomic Abundance (%)',
                 'shrink': 0.2
             },
-            linewidths=0.5,  # Add grid lines
+            linewidths=0 if large else 0.5,  # Add grid lines
+            rasterized=large,
             # square=True,     # Make cells square
             ax=ax,
         )
@@ -124,8 +194,8 @@ class PlotUtils:
         plt.yticks(rotation=0, fontsize=8)
 
         plt.tight_layout()
-        plt.savefig(os.path.join(self.output_dir,f'taxonomic_abundance_heatmap.pdf'), dpi=300, bbox_inches='tight')
-        plt.savefig(os.path.join(self.output_dir,f'taxonomic_abundance_heatmap.png'), dpi=300, bbox_inches='tight')
+        self._save_plot(plt.gcf(), 'taxonomic_abundance_heatmap')
+        plt.close()
 
 
         ### Taxonomic Abundance Full ###
@@ -133,8 +203,7 @@ class PlotUtils:
         fig,ax = plt.subplots(figsize=(8,10+pdf['Sample'].nunique()*0.2),dpi=300)
         # strains = pdf['Strain'].unique()
 
-        pivot_pdf = pdf.pivot(index='Sample', columns='Strain', values='Taxonomic_abundance')
-        pivot_pdf = pivot_pdf.reindex(natsort.natsorted(pivot_pdf.index.tolist(),reverse=True))
+        pivot_pdf = abund.reindex(natsort.natsorted(abund.index.tolist(),reverse=True))
 
         # add edges
         pivot_pdf.plot(
@@ -152,30 +221,32 @@ class PlotUtils:
         plt.title('Taxonomic Abundance Per Sample')
         plt.tight_layout()
         sns.despine()
-        plt.savefig(os.path.join(self.output_dir,f'taxonomic_abundance_profile_barplot.pdf'), dpi=300, bbox_inches='tight')
-        plt.savefig(os.path.join(self.output_dir,f'taxonomic_abundance_profile_barplot.png'), dpi=300, bbox_inches='tight')
+        self._save_plot(plt.gcf(), 'taxonomic_abundance_profile_barplot')
+        plt.close()
 
 
         ### Taxonomic Abundance per Sample ###
-        for sample in pdf['Sample'].unique():
-            sample_df = pdf[pdf['Sample'] == sample]
+        for sample, sample_df in pdf.groupby('Sample', sort=False):
             sample_df = sample_df.sort_values('Taxonomic_abundance', ascending=False)
-            plt.figure(figsize=(8, 4), dpi=300)
-            sns.barplot(y='Strain', x='Taxonomic_abundance', hue='Strain', data=sample_df, palette=self.strain_colors)
+            self.strain_barh(sample_df, 'Taxonomic_abundance')
             plt.title(f'Taxonomic Abundance\n{sample}')
             plt.ylabel('')
             plt.xlabel('Taxonomic Abundance (%)')
             sns.despine()
             plt.tight_layout()
-            plt.savefig(os.path.join(self.output_dir,f'{sample}_taxonomic_abundance.pdf'), dpi=300, bbox_inches='tight')
-            plt.savefig(os.path.join(self.output_dir,f'{sample}_taxonomic_abundance.png'), dpi=300, bbox_inches='tight')
+            self._save_plot(plt.gcf(), f'{sample}_taxonomic_abundance')
+            plt.close()
         
 
         ### Absolute Taxonomic Abundance (normalized to sequencing depth) ###
 
-        for sample in pdf['Sample'].unique():
+        # salmon writes <sample>_salmon/aux_info/meta_info.json, so index the
+        # metadata by directory name; the substring scan is kept as a fallback
+        salmon_meta = {os.path.basename(os.path.dirname(os.path.dirname(x)))[:-len('_salmon')]: x for x in self.hmo_metadata}
+
+        def sample_depth(sample):
             # find the corresponding metadata
-            metadata = [x for x in self.hmo_metadata if sample in x][0]
+            metadata = salmon_meta.get(sample) or [x for x in self.hmo_metadata if sample in x][0]
             with open(metadata,'r') as f:
                 metadata = json.load(f)
             seq_depth = metadata['num_processed']
@@ -187,24 +258,33 @@ class PlotUtils:
                 r1_file = [x for x in self.args.paired_end if sample in x and self.args.r1_suffix in x][0]
                 r2_file = [x for x in self.args.paired_end if sample in x and self.args.r2_suffix in x][0]
                 avg_length = self.calculate_average_read_length(r1_file,r2_file)
+
+            return sample, seq_depth, avg_length
+
+        # Collect per-sample depth/read length first and apply them to the
+        # whole frame in one go instead of assigning back sample by sample.
+        # Reading the FASTQ heads is IO-bound, so samples are read in threads.
+        samples = pdf['Sample'].unique()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.args.threads)) as executor:
+            rows = list(executor.map(sample_depth, samples))
+
+        depth_df = pd.DataFrame.from_records(rows, columns=['Sample','Seq_depth','Avg_read_length']).set_index('Sample')
+        seq_depth = pdf['Sample'].map(depth_df['Seq_depth'])
+        avg_length = pdf['Sample'].map(depth_df['Avg_read_length'])
+        pdf['Taxonomic_abundance_absolute'] = 100 * ( pdf['Taxonomic_abundance'] / 100 ) * ( pdf['Eff_cov'] * pdf['Genome_size'] / avg_length ) / seq_depth
+        if self.args.paired_end:
+            pdf['Taxonomic_abundance_absolute'] = pdf['Taxonomic_abundance_absolute'] / 2
+
+        for sample, sample_df in pdf.groupby('Sample', sort=False):
             
-            sample_df = pdf[pdf['Sample'] == sample]
-            sample_df['Taxonomic_abundance_absolute'] = 100 * ( sample_df['Taxonomic_abundance'] / 100 ) * ( sample_df['Eff_cov'] * sample_df['Genome_size'] / avg_length ) / seq_depth
-            if self.args.paired_end:
-                sample_df['Taxonomic_abundance_absolute'] = sample_df['Taxonomic_abundance_absolute'] / 2
-            
-            plt.figure(figsize=(8, 4), dpi=300)
-            sns.barplot(y='Strain', x='Taxonomic_abundance_absolute', hue='Strain', data=sample_df, palette=self.strain_colors)
+            self.strain_barh(sample_df, 'Taxonomic_abundance_absolute')
             plt.title(f'Absolute Taxonomic Abundance\n{sample}')
             plt.ylabel('')
             plt.xlabel('Absolute Taxonomic Abundance (%)')
             sns.despine()
             plt.tight_layout()
-            plt.savefig(os.path.join(self.output_dir,f'{sample}_absolute_taxonomic_abundance.pdf'), dpi=300, bbox_inches='tight')
-            plt.savefig(os.path.join(self.output_dir,f'{sample}_absolute_taxonomic_abundance.png'), dpi=300, bbox_inches='tight')
-
-            pdf.loc[pdf['Sample'] == sample,'Taxonomic_abundance_absolute'] = sample_df['Taxonomic_abundance_absolute']
-    
+            self._save_plot(plt.gcf(), f'{sample}_absolute_taxonomic_abundance')
+            plt.close()
     
         ### Absolute Taxonomic Abundance Full ###
 
@@ -230,8 +310,8 @@ class PlotUtils:
         plt.title('Taxonomic Abundance Per Sample')
         plt.tight_layout()
         sns.despine()
-        plt.savefig(os.path.join(self.output_dir,f'absolute_taxonomic_abundance_profile_barplot.pdf'), dpi=300, bbox_inches='tight')
-        plt.savefig(os.path.join(self.output_dir,f'absolute_taxonomic_abundance_profile_barplot.png'), dpi=300, bbox_inches='tight')
+        self._save_plot(plt.gcf(), 'absolute_taxonomic_abundance_profile_barplot')
+        plt.close()
 
 
         
@@ -260,19 +340,38 @@ class PlotUtils:
 
 
 
+    def strain_barh(self, df, value_col):
+        # One horizontal bar per strain, top to bottom in row order, drawn
+        # directly with matplotlib (same layout as sns.barplot(y='Strain'))
+        df = df.dropna(subset=['Strain'])
+        strains = df['Strain'].tolist()
+        positions = np.arange(len(strains))
+        fig, ax = plt.subplots(figsize=(8, 4), dpi=300)
+        # sns.barplot draws its bars at saturation=0.75
+        ax.barh(positions, df[value_col].to_numpy(), height=0.8,
+                color=[sns.desaturate(self.strain_colors[strain], 0.75) for strain in strains])
+        ax.set_yticks(positions)
+        ax.set_yticklabels(strains)
+        ax.set_ylim(len(strains) - 0.5, -0.5)
+        return fig
+
     def calculate_average_read_length(self,fastq1, fastq2=None, num_reads=150):
 
-        def read_lengths(fastq_path, num_reads):
-            lengths = []
+        def read_lengths(fastq_path, num_reads, chunk_size=65536):
+            # Read just enough of the (compressed) file in binary chunks to
+            # cover num_reads 4-line records, then take every sequence line
             opener = gzip.open if fastq_path.endswith(".gz") else open
-            with opener(fastq_path, 'rt') as f:
-                for i, line in enumerate(f):
-                    # Read the sequence line in the 4-line FASTQ format
-                    if i % 4 == 1:  # Sequence line is the second line of each 4-line group
-                        lengths.append(len(line.strip()))
-                    if len(lengths) >= num_reads:
+            chunks, newlines = [], 0
+            with opener(fastq_path, 'rb') as f:
+                while newlines < 4 * num_reads:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
                         break
-            return lengths
+                    chunks.append(chunk)
+                    newlines += chunk.count(b'\n')
+            lines = b''.join(chunks).split(b'\n')
+            # Sequence line is the second line of each 4-line group
+            return [len(line.strip()) for line in lines[1:4 * num_reads:4]]
         
         # Get read lengths from the first file
         lengths = read_lengths(fastq1, num_reads)
@@ -290,24 +389,24 @@ class PlotUtils:
         dfs = []
 
         for file in self.hmo_genes:
-            df = pd.read_csv(file, sep='\t')
+            # TPMs end up in HMO_genes.csv, so parse them with the C engine
+            df = pd.read_csv(file, sep='\t', engine='c')
             label = os.path.basename(file).replace('.salmon_counts_annotated.tsv','')
             
             ### Cluster Completion Plots ###
             fig = self.cluster_completion_plot(df, label)
-            fig.savefig(os.path.join(self.output_dir,f'{label}_HMO_cluster_completion.pdf'), dpi=300, bbox_inches='tight')
-            fig.savefig(os.path.join(self.output_dir,f'{label}_HMO_cluster_completion.png'), dpi=300, bbox_inches='tight')
+            self._save_plot(fig, f'{label}_HMO_cluster_completion', dpi=300, png_dpi=150)
+            plt.close(fig)
             
-            df = df[['Name', 'Cluster', 'TPM']]
-            df = df.rename(columns={'TPM': label})
-            dfs.append(df)
-
-        # Merge all DataFrames on 'Name' and 'Cluster'
-        salmon_df = dfs[0]
-        for df in dfs[1:]:
-            salmon_df = pd.merge(salmon_df, df, on=['Name', 'Cluster'], how='outer')
+            dfs.append(df.set_index(['Name', 'Cluster'])['TPM'].rename(label))
+
+        # Align all samples on 'Name' and 'Cluster' in one pass (same rows as
+        # chaining outer merges, without rebuilding the frame per sample)
+        salmon_df = pd.concat(dfs, axis=1)
+        if len(dfs) > 1:
+            salmon_df = salmon_df.sort_index()
         
-        self.salmon_df = salmon_df
+        self.salmon_df = salmon_df.reset_index()
 
     def plot_hmo_genes(self):
 
@@ -399,8 +498,8 @@ class PlotUtils:
 
         plt.suptitle('Presence of HMO Genes by Cluster (RPM)', y=0.99, fontsize=10)
         plt.tight_layout(rect=[0, 0, 0.9, 1])  # Adjust layout to account for title and spacing
-        plt.savefig(os.path.join(self.output_dir,'hmo_gene_cluster_RPM_heatmap.pdf'), dpi=300, bbox_inches='tight')
-        plt.savefig(os.path.join(self.output_dir,'hmo_gene_cluster_RPM_heatmap.png'), dpi=300, bbox_inches='tight')
+        self._save_plot(plt.gcf(), 'hmo_gene_cluster_RPM_heatmap')
+        plt.close()
 
 
         ### HMO Gene Cluster Heatmap (Binary Version) ###
@@ -445,16 +544,16 @@ class PlotUtils:
 
         plt.suptitle('Presence of HMO Genes by Cluster (RPM)', y=0.99, fontsize=10)
         plt.tight_layout(rect=[0, 0, 0.9, 1])  # Adjust layout to account for title and spacing
-        plt.savefig(os.path.join(self.output_dir,'hmo_gene_cluster_RPM_heatmap_binary.pdf'), dpi=300, bbox_inches='tight')
-        plt.savefig(os.path.join(self.output_dir,'hmo_gene_cluster_RPM_heatmap_binary.png'), dpi=300, bbox_inches='tight')
+        self._save_plot(plt.gcf(), 'hmo_gene_cluster_RPM_heatmap_binary')
+        plt.close()
 
 
         ### Gene Cassette Plots ###
 
         for sample in salmon_df.columns.tolist()[2:]:
             fig = self.gene_cassette_plots(salmon_df, rpm_col=sample)
-            fig.savefig(os.path.join(self.output_dir,f'{sample}_hmo_gene_cluster_RPM.pdf'), dpi=300, bbox_inches='tight')
-            fig.savefig(os.path.join(self.output_dir,f'{sample}_hmo_gene_cluster_RPM.png'), dpi=300, bbox_inches='tight')
+            self._save_plot(fig, f'{sample}_hmo_gene_cluster_RPM')
+            plt.close(fig)
         
 
         salmon_df.to_csv(os.path.join(self.output_dir,'HMO_genes.csv'),index=False)
@@ -462,8 +561,8 @@ class PlotUtils:
 
     def plot_sylph_query(self):
 
-        qdf = pd.read_csv(self.sylph_query,sep='\t')
-        qdf['Sample'] = qdf['Sample_file'].apply(lambda x: os.path.basename(x).replace('.fastq.gz','').replace(self.args.r1_suffix,'').replace(self.args.r2_suffix,''))
+        qdf = self._query_df.copy()
+        qdf['Sample'] = qdf['Sample_file'].map(os.path.basename).str.replace(self._query_sample_re,'',regex=True)
         qdf = qdf.merge(self.genomes_df,how='left',on='Genome_file').drop_duplicates()
         qdf['Strain'] = qdf['Label']
         strains = qdf['Strain'].unique()
@@ -472,20 +571,27 @@ class PlotUtils:
 
         ### Containment Indices ###
         # This makes a separate plot for each sample
-        for sample in qdf['Sample'].unique():
-            fig = self.containment_indices_barplot_horiz(qdf[qdf['Sample'] == sample])
-            fig.savefig(os.path.join(self.output_dir,f'{sample}_containment_indices.pdf'), dpi=300, bbox_inches='tight')
-            fig.savefig(os.path.join(self.output_dir,f'{sample}_containment_indices.png'), dpi=300, bbox_inches='tight')
+        jobs = [(sample_df, os.path.join(self.output_dir,f'{sample}_containment_indices'), not self.args.no_pdf)
+                for sample, sample_df in qdf.groupby('Sample', sort=False)]
+        workers = min(len(jobs), max(1, self.args.threads))
+        if workers <= 1:
+            for job in jobs:
+                _plot_containment_sample(job)
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(_plot_containment_sample, jobs))
 
 
 
 
-    def containment_indices_barplot_horiz(self,df,max_bars=10):
+    @staticmethod
+    def containment_indices_barplot_horiz(df,max_bars=10):
         n_genomes = df['Strain'].nunique()
         sample = df['Sample'].unique()[0]
         fig,ax = plt.subplots(figsize=(n_genomes/2,4),dpi=300)
-        df['numerator'] = df['Containment_ind'].apply(lambda x: x.split('/')[0]).astype(int)
-        df['denominator'] = df['Containment_ind'].apply(lambda x: x.split('/')[1]).astype(int)
+        containment = df['Containment_ind'].str.split('/', expand=True).astype(int)
+        df['numerator'] = containment[0]
+        df['denominator'] = containment[1]
         df['containment_index_float'] = df['numerator']/df['denominator']
         df.sort_values('containment_index_float',ascending=False,inplace=True)
         color = '#000'
@@ -503,9 +609,8 @@ class PlotUtils:
     def cluster_completion_plot(self, salmon_df, label):
         # Plot "Present" genes per cluster as bar plot
         salmon_df['Present'] = salmon_df['NumReads'] > self.rpm_threshold
-        clust_ct = salmon_df.groupby('Cluster').sum()['Present'].reset_index()
-        # Get total genes in each cluster
-        clust_ct['Total'] = salmon_df.groupby('Cluster').count()['Name'].values
+        # Count present and total genes in each cluster in a single pass
+        clust_ct = salmon_df.groupby('Cluster').agg(Present=('Present', 'sum'), Total=('Name', 'count')).reset_index()
         clust_ct['Percent'] = clust_ct['Present'] / clust_ct['Total'] * 100
         # Define colors
         clusters = salmon_df['Cluster'].unique()
@@ -513,6 +618,9 @@ class PlotUtils:
         cluster_colors = {cluster: color_palette(i) for i, cluster in enumerate(clusters)}
         fig,ax = plt.subplots(figsize=(3,2), dpi=300)
         sns.barplot(x='Cluster', y='Percent', hue='Cluster', data=clust_ct, ax=ax, palette=cluster_colors)
+        # Rasterize the bars so the per-sample PDF stays small
+        for patch in ax.patches:
+            patch.set_rasterized(True)
         plt.xticks(rotation=90)
         plt.title('Percent of HMO genes detected\nin each cluster')
         plt.ylabel('Percent')
@@ -8,10 +8,11 @@ import os
 import re
 from typing import List, Dict, Optional, Union
 from pathlib import Path
-from collections import defaultdict
+from collections import Counter, defaultdict
 from .logger import logger
 
 VALID_EXTENSIONS = ('.fastq', '.fastq.gz', '.fq', '.fq.gz')
+_EXT_RE = re.compile(r'\.f(?:ast)?q(?:\.gz)?$', re.IGNORECASE)
 
 def validate_files(files: List[str]) -> None:
     """Validate that all files exist and have correct extensions.
@@ -23,11 +24,27 @@ def validate_files(files: List[str]) -> None:
         FileNotFoundError: If any file is missing.
         ValueError: If any file has an invalid extension.
     """
+    # Scan each parent directory once instead of stat-ing every file
+    files_by_dir: Dict[str, Dict[str, str]] = defaultdict(dict)
     for file in files:
-        if not os.path.isfile(file):
-            raise FileNotFoundError(f"File not found: {file}")
-            
-        if not any(file.lower().endswith(ext) for ext in VALID_EXTENSIONS):
+        files_by_dir[os.path.dirname(file)][os.path.basename(file)] = file
+    
+    for directory, dir_files in files_by_dir.items():
+        # Only type-check entries we asked for; is_file() may need a stat
+        # for symlinks, so skip the rest of a large directory cheaply
+        try:
+            with os.scandir(directory or '.') as entries:
+                present = {entry.name for entry in entries if entry.name in dir_files and entry.is_file()}
+        except (FileNotFoundError, NotADirectoryError):
+            present = set()
+        for name, file in dir_files.items():
+            # No exact hit can still be the same file on a case-insensitive
+            # filesystem (macOS/Windows), so fall back to a stat there
+            if name not in present and not os.path.isfile(file):
+                raise FileNotFoundError(f"File not found: {file}")
+    
+    for file in files:
+        if not file.lower().endswith(VALID_EXTENSIONS):
             raise ValueError(
                 f"Invalid file extension for {file}. Must be one of: {', '.join(VALID_EXTENSIONS)}"
             )
@@ -45,31 +62,34 @@ def get_base_name(filename: str, r1_suffix: str, r2_suffix: str) -> str:
     """
     basename = os.path.basename(filename)
     # Remove common suffixes first
-    basename = re.sub(r'\.f(ast)?q(\.gz)?$', '', basename, flags=re.IGNORECASE)
+    basename = _EXT_RE.sub('', basename)
     # Remove R1/R2 patterns using provided suffixes
     basename = basename.replace(r1_suffix, '').replace(r2_suffix, '')
     return basename
 
-def make_absolute_path(file: Union[str, Path], base_dir: Union[str, Path]) -> str:
+def make_absolute_path(file: Union[str, Path], base_dir: Union[str, Path], resolve: bool = False) -> str:
     """Convert a file path to an absolute path if it isn't already.
     
     Args:
         file: File path to convert.
         base_dir: Base directory to use for relative paths.
+        resolve: Also resolve symlinks. This stats every path component,
+            which is slow on network filesystems, so it is off by default.
         
     Returns:
         An absolute path to the file.
     """
-    file_path = Path(file)
-    if not file_path.is_absolute():
-        file_path = Path(base_dir) / file_path
-    return str(file_path.resolve())
+    file_path = os.path.join(os.fspath(base_dir), os.fspath(file))
+    if resolve:
+        return str(Path(file_path).resolve())
+    return os.path.abspath(file_path)
 
 def build_sample_dict(
     single_end: Optional[List[str]] = None, 
     paired_end: Optional[List[str]] = None,
     r1_suffix: str = "_R1",
-    r2_suffix: str = "_R2"
+    r2_suffix: str = "_R2",
+    sort_samples: bool = True
 ) -> Dict[str, Dict[str, Union[str, Dict[str, str]]]]:
     """Build a dictionary mapping sample names to their input files.
     
@@ -78,6 +98,8 @@ def build_sample_dict(
         paired_end: List of paired-end FASTQ files (both R1 and R2).
         r1_suffix: Suffix identifying R1 files in paired-end mode.
         r2_suffix: Suffix identifying R2 files in paired-end mode.
+        sort_samples: Order paired-end samples by name. If False they keep
+            the order in which their first file was given.
         
     Returns:
         A dictionary mapping sample names to their file information.
@@ -116,13 +138,12 @@ def build_sample_dict(
             
             # Check for duplicate sample names
             sample_names = [get_base_name(f, r1_suffix, r2_suffix) for f in single_end]
-            duplicate_names = {name for name in sample_names if sample_names.count(name) > 1}
+            duplicate_names = [name for name, count in Counter(sample_names).items() if count > 1]
             if duplicate_names:
                 raise ValueError(f"Found duplicate sample names: {', '.join(duplicate_names)}")
             
             # Build sample dictionary
-            for file in single_end:
-                sample_name = get_base_name(file, r1_suffix, r2_suffix)
+            for file, sample_name in zip(single_end, sample_names):
                 sample_dict[sample_name] = {
                     'type': 'single-end',
                     'files': {'R1': file}
@@ -135,29 +156,29 @@ def build_sample_dict(
             paired_end = [make_absolute_path(file, base_dir) for file in paired_end]
             validate_files(paired_end)
             
-            # Group paired-end files by their base name
-            r1_files: Dict[str, str] = {}
-            r2_files: Dict[str, str] = {}
+            # Single pass: group files by base name into their R1/R2 slots
+            groups: Dict[str, Dict[str, str]] = defaultdict(dict)
             unmatched_files: List[str] = []
             
-            # First pass: sort files into R1 and R2 groups
             for file in paired_end:
-                basename = get_base_name(file, r1_suffix, r2_suffix)
-                if r1_suffix in file and r2_suffix in file:
+                # Only the file name decides R1/R2, so a directory named e.g.
+                # run_R1/ can't be mistaken for a read suffix
+                name = os.path.basename(file)
+                has_r1 = r1_suffix in name
+                has_r2 = r2_suffix in name
+                if has_r1 and has_r2:
                     raise ValueError(
                         f"File contains both R1 and R2 suffixes: {file}. "
                         f"Check suffix settings: R1='{r1_suffix}', R2='{r2_suffix}'"
                     )
-                elif r1_suffix in file:
-                    if basename in r1_files:
-                        raise ValueError(f"Duplicate R1 file found for sample {basename}")
-                    r1_files[basename] = file
-                elif r2_suffix in file:
-                    if basename in r2_files:
-                        raise ValueError(f"Duplicate R2 file found for sample {basename}")
-                    r2_files[basename] = file
-                else:
+                elif not has_r1 and not has_r2:
                     unmatched_files.append(file)
+                    continue
+                read = 'R1' if has_r1 else 'R2'
+                basename = get_base_name(name, r1_suffix, r2_suffix)
+                if read in groups[basename]:
+                    raise ValueError(f"Duplicate {read} file found for sample {basename}")
+                groups[basename][read] = file
             
             if unmatched_files:
                 raise ValueError(
@@ -165,34 +186,32 @@ def build_sample_dict(
                     f"patterns: {', '.join(unmatched_files)}"
                 )
             
-            # Second pass: match pairs and validate
-            all_samples = set(r1_files.keys()) | set(r2_files.keys())
-            if not all_samples:
+            if not groups:
                 raise ValueError(
                     f"No valid paired-end files found. Ensure files contain '{r1_suffix}' "
                     f"or '{r2_suffix}' in their names."
                 )
                 
             # Check for missing pairs
-            unpaired_r1 = set(r1_files.keys()) - set(r2_files.keys())
-            unpaired_r2 = set(r2_files.keys()) - set(r1_files.keys())
+            unpaired_r1 = [sample for sample, reads in groups.items() if 'R2' not in reads]
+            unpaired_r2 = [sample for sample, reads in groups.items() if 'R1' not in reads]
             if unpaired_r1:
                 raise ValueError(f"Missing R2 files for samples: {', '.join(unpaired_r1)}")
             if unpaired_r2:
                 raise ValueError(f"Missing R1 files for samples: {', '.join(unpaired_r2)}")
             
             # Build final sample dictionary
-            for sample in sorted(all_samples):
-                sample_dict[sample] = {
+            sample_dict = {
+                sample: {
                     'type': 'paired-end',
-                    'files': {
-                        'R1': r1_files[sample],
-                        'R2': r2_files[sample]
-                    }
+                    'files': {'R1': groups[sample]['R1'], 'R2': groups[sample]['R2']}
                 }
+                for sample in (sorted(groups) if sort_samples else groups)
+            }
+            for sample, info in sample_dict.items():
                 logger.debug(
                     f"Added paired-end sample {sample}: "
-                    f"R1={r1_files[sample]}, R2={r2_files[sample]}"
+                    f"R1={info['files']['R1']}, R2={info['files']['R2']}"
                 )
                 
         logger.info(f"Successfully processed {len(sample_dict)} samples")
@@ -1,10 +1,12 @@
 import os
 import sys
-import pkg_resources
 import pathlib
 from .logger import logger
 
 class ReferenceManager:
+
+    # Shared across instances so the reference files are only stat-ed once per process
+    _references_validated = False
     
     def __init__(self):
         # Get the package's root directory
@@ -16,33 +18,31 @@ class ReferenceManager:
             raise FileNotFoundError(f"Reference directory not found at {self.reference_dir}")
         
         # Dictionary to store reference file paths
+        # Stored as strings, since that is what every caller wants
         self._reference_files = {
-            'humann2_hmo': self.reference_dir / 'humann2_HMO_annotation.csv',
-            'bl_genome': self.reference_dir / 'CP001095.1_genome.fasta',
-            'bl_genes': self.reference_dir / 'CP001095.1_gene_sequences.fasta',
-            'genomes_df': self.reference_dir / 'genomes.csv',
-            'bifidobacteria_sketches': self.reference_dir / 'bifidobacteria_sketches.syldb',
+            'humann2_hmo': str(self.reference_dir / 'humann2_HMO_annotation.csv'),
+            'bl_genome': str(self.reference_dir / 'CP001095.1_genome.fasta'),
+            'bl_genes': str(self.reference_dir / 'CP001095.1_gene_sequences.fasta'),
+            'genomes_df': str(self.reference_dir / 'genomes.csv'),
+            'bifidobacteria_sketches': str(self.reference_dir / 'bifidobacteria_sketches.syldb'),
         }
 
-        # Flag to track validation status
-        self._references_validated = False
-
         # Validate all reference files exist
         self._validate_references()
-        logger.info("References validated.")  # Log only once after validation
 
     def _validate_references(self):
         if self._references_validated:  # Skip validation if already done
             return
         for name, path in self._reference_files.items():
-            if not path.exists():
+            if not os.path.exists(path):
                 raise FileNotFoundError(f"Required reference file '{name}' not found at {path}")
-        self._references_validated = True  # Mark as validated
+        type(self)._references_validated = True  # Mark as validated
+        logger.info("References validated.")  # Log only once after validation
     
     def get_reference_path(self, reference_name):
         if reference_name not in self._reference_files:
             raise ValueError(f"Unknown reference '{reference_name}'. Available references: {list(self._reference_files.keys())}")
-        return str(self._reference_files[reference_name])
+        return self._reference_files[reference_name]
 
     def get_reference_dir(self):
         return str(self.reference_dir)
@@ -1,13 +1,22 @@
 import os
-import glob
+import re
+import bisect
+import collections
+import hashlib
+import itertools
 import subprocess
+import tempfile
 import typing
 from pathlib import Path
 from .logger import logger
-import pandas as pd
-import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
+
+_FASTQ_EXT_RE = re.compile(r'\.f(?:ast)?q(?:\.gz)?$')
+def _fastq_stem(fastq):
+    """File name of a FASTQ with its .fastq/.fq(.gz) extension removed."""
+    return _FASTQ_EXT_RE.sub('', os.path.basename(fastq))
+
+# Beyond this many sketches, query/profile read them from a list file
+_MAX_ARGV_SKETCHES = 64
 
 class SylphUtils:
     def __init__(self,args,sylph_executable):
@@ -24,14 +33,32 @@ class SylphUtils:
             os.makedirs(dir_path, exist_ok=True)
     
     def _run_command(self, command: typing.List[str]) -> subprocess.CompletedProcess:
-        try:
-            if self.args.verbose:
-                logger.info(f"Running command: {' '.join(command)}")
-            result = subprocess.run(command, check=True, text=True, capture_output=True, shell=False)
-            return result
-        except subprocess.CalledProcessError:
-            logger.exception(f"Command failed: {' '.join(command)}")
-            raise
+        # sylph writes its results to -o/-d paths, so stdout is discarded.
+        # In verbose mode stderr is streamed into the log as it arrives;
+        # otherwise it is spooled to disk rather than held in memory and only
+        # read back to report a failure
+        if self.args.verbose:
+            logger.info(f"Running command: {' '.join(command)}")
+            tail = collections.deque(maxlen=50)
+            with subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors='replace') as proc:
+                for line in proc.stderr:
+                    line = line.rstrip()
+                    logger.info(line)
+                    tail.append(line)
+                returncode = proc.wait()
+            if returncode != 0:
+                logger.error(f"Command failed: {' '.join(command)}\n" + '\n'.join(tail))
+                raise subprocess.CalledProcessError(returncode, command)
+            return subprocess.CompletedProcess(command, returncode)
+
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                result = subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=stderr, shell=False)
+                return result
+            except subprocess.CalledProcessError:
+                stderr.seek(0)
+                logger.exception(f"Command failed: {' '.join(command)}\n{stderr.read().decode(errors='replace')}")
+                raise
     
     def sketch_reads(self,
                      fastq_se: list = None,
@@ -41,19 +68,52 @@ class SylphUtils:
         missing_files = []
         command = []
 
+        def dedupe(fastq_files):
+            # Keyed on the resolved path so a FASTQ given twice (or through a
+            # symlink) is only sketched once; the first spelling is kept
+            unique = {}
+            for f in fastq_files:
+                unique.setdefault(os.path.realpath(f), f)
+            unique = list(unique.values())
+            if len(unique) < len(fastq_files):
+                logger.info(f"Ignoring {len(fastq_files) - len(unique)} duplicate FASTQ input(s).")
+            return unique
+
+        if fastq_se:
+            fastq_se = dedupe(fastq_se)
+        if fastq_r1:
+            # R2 files are derived from R1, so deduplicating R1 keeps the pairs intact
+            fastq_r1 = dedupe(fastq_r1)
+
+        # Scan the sketch dir and the base dir once; the sorted names let each
+        # FASTQ find its sketches by prefix instead of globbing per file
+        sylsp_index = {}
+        stray_sylsp = []
+        for directory in ('.', self.fastq_sketch_dir):
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.sylsp'):
+                        if directory == '.':
+                            stray_sylsp.append(entry.name)
+                        sylsp_index[entry.name] = entry.name if directory == '.' else os.path.join(directory, entry.name)
+        sylsp_names = sorted(sylsp_index)
+
+        def sylsp_with_prefix(prefix):
+            start = bisect.bisect_left(sylsp_names, prefix)
+            return list(itertools.takewhile(lambda name: name.startswith(prefix), sylsp_names[start:]))
+
+        def has_sketch(fastq):
+            # sylph names read sketches <fastq>.sylsp, or <R1 fastq>.paired.sylsp
+            name = os.path.basename(fastq)
+            return f'{name}.sylsp' in sylsp_index or f'{name}.paired.sylsp' in sylsp_index
+
         def find_existing_sylsp(fastq_files):
             """Find existing .sylsp files for the given FASTQ files."""
-            existing_files = []
-            for fastq in fastq_files:
-                base_name = os.path.basename(fastq).replace('.fastq.gz', '').replace('.fastq', '').replace('.fq.gz', '').replace('.fq', '')
-                sylsp_pattern = f"{base_name}*.sylsp"  # Match any .sylsp file with the base name
-                sylsp_files = glob.glob(os.path.join(self.fastq_sketch_dir, sylsp_pattern)) + glob.glob(sylsp_pattern)
-                existing_files.extend(sylsp_files)
-            return existing_files
+            return [sylsp_index[name] for fastq in fastq_files for name in sylsp_with_prefix(_fastq_stem(fastq))]
 
         if fastq_se:
             existing_files = find_existing_sylsp(fastq_se)
-            missing_files = [f for f in fastq_se if not any(os.path.basename(f).replace('.fastq.gz', '').replace('.fastq', '').replace('.fq.gz', '').replace('.fq', '') in ef for ef in existing_files)]
+            missing_files = [f for f in fastq_se if not has_sketch(f)]
             if len(existing_files) > 0 and len(missing_files) == 0:
                 pass
             elif len(existing_files) > 0:
@@ -61,10 +121,10 @@ class SylphUtils:
             else:
                 logger.info(f"No existing .sylsp files found. Sketching all {len(missing_files)} samples.")
             if missing_files:
-                command = [self.sylph_executable, 'sketch', *missing_files, '-t', str(threads)]
+                command = [self.sylph_executable, 'sketch', *missing_files, '-d', self.fastq_sketch_dir, '-t', str(threads)]
         elif fastq_r1 and fastq_r2:
             existing_files_r1 = find_existing_sylsp(fastq_r1)
-            missing_files_r1 = [f for f in fastq_r1 if not any(os.path.basename(f) in ef for ef in existing_files_r1)]
+            missing_files_r1 = [f for f in fastq_r1 if not has_sketch(f)]
             missing_files_r2 = [f.replace(self.args.r1_suffix,self.args.r2_suffix) for f in missing_files_r1]
             if len(existing_files_r1) > 0 and len(missing_files_r1) == 0:
                 pass
@@ -73,7 +133,7 @@ class SylphUtils:
             else:
                 logger.info(f"No existing .sylsp files found. Sketching all {len(missing_files_r1)} samples.")
             if missing_files_r1:
-                command = [self.sylph_executable, 'sketch', '-1', *missing_files_r1, '-2', *missing_files_r2, '-t', str(threads)]
+                command = [self.sylph_executable, 'sketch', '-1', *missing_files_r1, '-2', *missing_files_r2, '-d', self.fastq_sketch_dir, '-t', str(threads)]
         else:
             raise ValueError("Either fastq_se or fastq_r1 and fastq_r2 must be provided")
 
@@ -83,40 +143,91 @@ class SylphUtils:
         else:
             logger.info("All .sylsp files are present. Skipping Sylph sketch command.")
 
-        # Move any .sylsp files in the base dir to the fastq_sketch_dir
-        for sylsp in glob.glob('*.sylsp'):
-            os.rename(sylsp, os.path.join(self.fastq_sketch_dir, sylsp))
+        # Sketches are written straight into fastq_sketch_dir (-d); this only
+        # moves .sylsp files left in the base dir by older runs, which the
+        # scan above already found
+        for sylsp in stray_sylsp:
+            os.replace(sylsp, os.path.join(self.fastq_sketch_dir, sylsp))
 
         # Return paths to all existing .sylsp files
-        return glob.glob(os.path.join(self.fastq_sketch_dir, '*.sylsp'))
+        with os.scandir(self.fastq_sketch_dir) as entries:
+            return [os.path.join(self.fastq_sketch_dir, entry.name) for entry in entries if entry.name.endswith('.sylsp')]
     
+    @staticmethod
+    def _inputs_key(subcommand, sylsp_files, syldb_file):
+        """Hash of the sylph subcommand and the path, size and mtime of every input."""
+        h = hashlib.sha256(subcommand.encode())
+        for path in sorted(sylsp_files) + [syldb_file]:
+            st = os.stat(path)
+            h.update(f'{path}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode())
+        return h.hexdigest()
+
+    def _run_sylph_search(self, subcommand, sylsp_files, syldb_file, output_path, threads):
+        """Run sylph query/profile, passing large sketch lists through a -l list file.
+
+        The inputs' key is stored next to the output, and the run is skipped
+        when the output already exists for exactly the same inputs.
+        """
+        key_path = f'{output_path}.inputs'
+        key = self._inputs_key(subcommand, sylsp_files, syldb_file)
+        if os.path.exists(output_path) and os.path.exists(key_path):
+            with open(key_path) as f:
+                if f.read() == key:
+                    logger.info(f"Sylph {subcommand} inputs unchanged. Reusing {output_path}")
+                    return
+
+        # Drop the old key before running, and only publish the output and its
+        # key once sylph has succeeded, so a failed run can't leave a partial
+        # TSV that a later run with the old inputs would mistake for reusable
+        if os.path.exists(key_path):
+            os.remove(key_path)
+        tmp_path = f'{output_path}.tmp'
+        # threads=None leaves the thread count to sylph's own default
+        thread_args = ['-t', str(threads)] if threads else []
+        try:
+            if len(sylsp_files) <= _MAX_ARGV_SKETCHES:
+                self._run_command([self.sylph_executable, subcommand, *sylsp_files, syldb_file, '-o', tmp_path, *thread_args])
+            else:
+                # Thousands of sketch paths would bloat argv (and can hit ARG_MAX)
+                list_path = f'{output_path}.filelist.txt'
+                with open(list_path, 'w') as f:
+                    f.write('\n'.join(sylsp_files) + '\n')
+                try:
+                    self._run_command([self.sylph_executable, subcommand, syldb_file, '-l', list_path, '-o', tmp_path, *thread_args])
+                finally:
+                    os.remove(list_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, output_path)
+
+        with open(key_path, 'w') as f:
+            f.write(key)
+
     def query_genomes(self, 
                       sylsp_files: typing.List[str], 
                       syldb_file: str, 
-                      output_name: str = 'genome_query.tsv') -> str:
+                      output_name: str = 'genome_query.tsv',
+                      threads: typing.Optional[int] = None) -> str:
         
-        # Construct sylph query command
-        command = [self.sylph_executable, 'query'] + sylsp_files + [syldb_file, '-o', output_name]
-        self._run_command(command)
+        # Run sylph query, writing straight into the genome query directory
+        output_path = os.path.join(self.genome_query_dir, output_name)
+        self._run_sylph_search('query', sylsp_files, syldb_file, output_path, threads)
 
-        # Move the output file into the genome query directory
-        os.rename(output_name, os.path.join(self.genome_query_dir, output_name))
-
-        return os.path.join(self.genome_query_dir, output_name)
+        return output_path
     
     def profile_genomes(self, 
                         sylsp_files: typing.List[str], 
                         syldb_file: str, 
-                        output_name: str = 'genome_profile.tsv') -> str:
+                        output_name: str = 'genome_profile.tsv',
+                        threads: typing.Optional[int] = None) -> str:
         
-        # Construct sylph profile command
-        command = [self.sylph_executable, 'profile'] + sylsp_files + [syldb_file, '-o', output_name]
-        self._run_command(command)
+        # Run sylph profile, writing straight into the genome query directory
+        output_path = os.path.join(self.genome_query_dir, output_name)
+        self._run_sylph_search('profile', sylsp_files, syldb_file, output_path, threads)
 
-        # Move the output file into the genome query directory
-        os.rename(output_name, os.path.join(self.genome_query_dir, output_name))
-        
-        return os.path.join(self.genome_query_dir, output_name)
+        return output_path
 
 
 
@@ -0,0 +1,11 @@
+import pandas as pd
+from packaging.version import Version
+
+# Use PyArrow's multi-threaded CSV parser when it's installed, for tables
+# that are not written back out (its float parsing can differ in the last digit).
+# read_csv only accepts engine='pyarrow' from pandas 1.4 onwards
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow' if Version(pd.__version__) >= Version('1.4') else 'c'
+except ImportError:
+    CSV_ENGINE = 'c'
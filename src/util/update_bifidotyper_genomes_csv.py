@@ -1,10 +1,35 @@
 import pandas as pd
 import os
+import sys
 import glob
+import numpy as np
+import concurrent.futures
 
 # This script takes as arguments a path to a set of .fna files and a path to a CSV file that may or may not exist
 # And updates the CSV file with the IDs, names, sizes, and colors for each genome that's not already present
 
+def scan_genome(genome_file):
+	"""Return the label and sequence length of a .fna file."""
+	# get label and size from fna, streaming in fixed-size chunks so a
+	# genome is never held in memory as a whole
+	with open(genome_file, 'rb') as f:
+		# First line is ">label"
+		label = f.readline().decode().strip()[1:]
+		sequence_start = f.tell()
+		# Rest is the sequence: plain sequence lines are everything but the newlines
+		sequence_length = 0
+		plain = True
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			if b'>' in chunk or any(ws in chunk for ws in (b'\r', b' ', b'\t')):
+				plain = False
+				break
+			sequence_length += len(chunk) - chunk.count(b'\n')
+		if not plain:
+			# Multi-contig or untidy file: count the length of any line that doesn't start with ">"
+			f.seek(sequence_start)
+			sequence_length = sum(len(line.strip()) for line in f if not line.startswith(b'>'))
+	return label, sequence_length
+
 # parse CLI arguments in order
 # first one is path, second is csv
 import argparse
@@ -13,48 +38,64 @@ parser.add_argument('genomes_path', type=str, help='Path to the directory contai
 parser.add_argument('csv_path', type=str, help='Path to the CSV file to update.')
 args = parser.parse_args()
 
-if os.path.exists(csv_path):
-	df = pd.read_csv(csv_path)
+# Explicit dtypes keep the text columns as pandas strings instead of per-cell Python objects
+GENOME_DTYPES = {'Genome_file': 'string', 'Label': 'string', 'Genome_size': 'Int64', 'Color': 'string'}
+
+if os.path.exists(args.csv_path):
+	df = pd.read_csv(args.csv_path, dtype=GENOME_DTYPES)
 else:
-	df = pd.DataFrame(columns=['Genome_file','Label','Genome_size','Color'])
+	df = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in GENOME_DTYPES.items()})
 
 # Get all .fna files in the specified directory
 genome_files = glob.glob(os.path.join(args.genomes_path, '*.fna'))
 
 if not genome_files:
 	print(f"No .fna files found in the directory: {args.genomes_path}")
+	sys.exit(0)
 
-# Iterate through each genome file and extract information
+# Collect new rows and write them in one go
+new_rows = []
+existing_genomes = set(df['Genome_file'])
+
+# Skip genomes that are already in the DataFrame
+todo = []
 for genome_file in genome_files:
-	# Check if it's in the DataFrame already
 	name = os.path.basename(genome_file)
-	if name in df['Genome_file'].values:
+	if name in existing_genomes:
 		print(f"Genome {name} already exists in the CSV. Skipping.")
 		continue
-	
-	# get label and size from fna
-	with open(genome_file, 'r') as f:
-		first_line = f.readline().strip()
-		# First line is ">label"
-		label = first_line[1:]
-		# Rest is the sequence
-		# Go through and count the length of any line that doesn't start with ">"
-		sequence_length = 0
-		for line in f:
-			if not line.startswith('>'):
-				sequence_length += len(line.strip())
-	
-	# Pick a random color
-	import random
-	color = "#{:06x}".format(random.randint(0, 0xFFFFFF))
-	# Append the new genome information to the DataFrame
-	new_row = {
+	todo.append(genome_file)
+
+# Genomes are independent and scanning is mostly file IO, so read them concurrently
+with concurrent.futures.ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4)) as executor:
+	scanned = list(executor.map(scan_genome, todo))
+
+# Pick a random color for every new genome in one draw
+colors = np.random.default_rng().integers(0, 0x1000000, size=len(todo))
+
+for genome_file, (label, sequence_length), color in zip(todo, scanned, np.char.mod('#%06x', colors)):
+	name = os.path.basename(genome_file)
+
+	# Record the new genome information
+	new_rows.append({
 		'Genome_file': name,
 		'Label': label,
 		'Genome_size': sequence_length,
-		'Color': color
-	}
-	df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+		'Color': str(color)
+	})
+
+if not new_rows and os.path.exists(args.csv_path):
+	# Nothing to add, leave the existing CSV untouched
+	sys.exit(0)
 
-# Save the updated DataFrame back to the CSV file
-df.to_csv(args.csv_path, index=False)
+new_df = pd.DataFrame(new_rows, columns=df.columns)
+if os.path.exists(args.csv_path) and os.path.getsize(args.csv_path) > 0:
+	# Append only the new genomes instead of rewriting the whole CSV,
+	# making sure they don't end up on the last existing line
+	with open(args.csv_path, 'rb+') as f:
+		f.seek(-1, os.SEEK_END)
+		if f.read(1) != b'\n':
+			f.write(b'\n')
+	new_df.to_csv(args.csv_path, mode='a', header=False, index=False)
+else:
+	new_df.to_csv(args.csv_path, index=False)